@@ -1,16 +1,63 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from google.cloud import ndb
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, flash, make_response, stream_with_context
+from markupsafe import Markup
+from google.api_core.retry import Retry
 from google.cloud import datastore
+from google.cloud.datastore import helpers
+from google.cloud.datastore_v1.types import query as query_pb2
 import os
 import json
+import asyncio
+import gzip
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import quote, unquote
 from dotenv import load_dotenv
+from datastore_clients import get_client, run_query
+from copy_jobs import start_copy_job, get_copy_job, list_copy_jobs, MAX_BATCH_SIZE, MAX_WORKERS
+from snapshot import list_snapshots, list_kinds, start_snapshot_job, list_snapshot_jobs, get_snapshot_dir
+from snapshot_backend import open_snapshot
+from render_cache import create_render_cache
+from live_feed import live_feed, content_hash
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'
+# serve.py turns compression on; the debug server leaves it off
+app.config['COMPRESS_RESPONSES'] = os.getenv('COMPRESS_RESPONSES', 'false').lower() in ('1', 'true', 'yes')
+
+# Async views run independent datastore calls concurrently on this pool;
+# its size caps how many emulator calls are in flight across all requests
+app.config['CONCURRENT_FETCH'] = os.getenv('CONCURRENT_FETCH', 'true').lower() in ('1', 'true', 'yes')
+DATASTORE_WORKERS = int(os.getenv('DATASTORE_WORKERS', 16))
+datastore_executor = ThreadPoolExecutor(max_workers=DATASTORE_WORKERS, thread_name_prefix='datastore')
+
+# How long the emulator project scan and kind lists are reused, in seconds
+PROJECT_SCAN_TTL = int(os.getenv('PROJECT_SCAN_TTL', 60))
+KIND_CACHE_TTL = int(os.getenv('KIND_CACHE_TTL', 30))
+
+# Opt-in cache of rendered browse/view fragments (RENDER_CACHE=true)
+render_cache = create_render_cache()
+
+# Entities per page of an entity's children panel
+CHILDREN_PER_PAGE = int(os.getenv('CHILDREN_PER_PAGE', 20))
+# Datastore lookups take at most 1000 keys; further references stay unresolved
+REFERENCE_LOOKUP_LIMIT = 1000
+# retry=None means the default retry policy, which keeps trying for a minute
+NO_RETRY = Retry(predicate=lambda exc: False)
+
+_project_scan = {'projects': None, 'expires': 0}
+_kind_cache = {}
+_cache_lock = threading.Lock()
 
 # Store current project in session
 def get_current_project():
@@ -21,13 +68,46 @@ def get_current_project():
 def set_current_project(project_name):
     """Set the current project in session"""
     from flask import session
+    close_offline_snapshot()
     session['current_project'] = project_name
     os.environ['GOOGLE_CLOUD_PROJECT'] = project_name
 
+def get_offline_snapshot():
+    """Get the snapshot file being browsed offline, if any"""
+    from flask import session
+    return session.get('offline_snapshot', os.getenv('OFFLINE_SNAPSHOT')) or None
+
+def close_offline_snapshot():
+    """Go back to the emulator for this session"""
+    from flask import session
+    # An empty entry (rather than none) keeps OFFLINE_SNAPSHOT from reopening it
+    session['offline_snapshot'] = ''
+
+def open_offline_snapshot():
+    """Open the snapshot being browsed, or None
+    
+    A snapshot file that was deleted or replaced by something unreadable
+    closes offline browsing instead of breaking every page.
+    """
+    offline_snapshot = get_offline_snapshot()
+    if not offline_snapshot:
+        return None
+    try:
+        return open_snapshot(offline_snapshot)
+    except (OSError, ValueError) as e:
+        close_offline_snapshot()
+        flash(f'Closed snapshot {os.path.basename(offline_snapshot)}: {str(e)}', 'error')
+        return None
+
 def get_available_projects():
     """Get list of available projects from the datastore emulator"""
     from flask import session
     
+    # Don't probe the emulator while browsing a snapshot without it
+    snapshot_client = open_offline_snapshot()
+    if snapshot_client is not None:
+        return [snapshot_client.project]
+    
     try:
         projects = set()
         
@@ -39,45 +119,93 @@ def get_available_projects():
         if 'known_projects' in session:
             projects.update(session['known_projects'])
         
-        # Try to detect projects by attempting connections
-        # The emulator stores data per-project, so we'll try common names
-        common_projects = [
-            'test-project',
-            'dev-project', 
-            'local-dev',
-            'emulator-project',
-            'mephysio-hrd-local',
-            'me-physio-hrd',
-        ]
-        
-        for proj in common_projects:
-            try:
-                # Try to connect to each project
-                os.environ['GOOGLE_CLOUD_PROJECT'] = proj
-                client = datastore.Client(project=proj)
-                query = client.query()
-                query.keys_only()
-                entities = list(query.fetch(limit=1))
-                # If we can fetch at least one entity, project has data
-                if entities:
-                    projects.add(proj)
-            except Exception:
-                # Project doesn't exist or has no data
-                pass
+        # Add projects detected in the emulator
+        projects.update(scan_projects())
         
         # Store known projects in session
         session['known_projects'] = list(projects)
         
-        # Restore original project
-        os.environ['GOOGLE_CLOUD_PROJECT'] = get_current_project()
-        
         return sorted(list(projects))
     except Exception as e:
         # Fallback to configured project
         return [os.getenv('GOOGLE_CLOUD_PROJECT', 'test-project')]
-    except Exception as e:
-        # Fallback to configured project
-        return [os.getenv('GOOGLE_CLOUD_PROJECT', 'test-project')]
+
+def scan_projects(refresh=False):
+    """Get the common project names that have data in the emulator
+    
+    Probing every project costs a round-trip each, and the navbar needs the
+    list on every page, so the result is shared by all requests for
+    PROJECT_SCAN_TTL seconds.
+    """
+    with _cache_lock:
+        if not refresh and _project_scan['projects'] is not None and time.monotonic() < _project_scan['expires']:
+            return _project_scan['projects']
+    
+    # Try to detect projects by attempting connections
+    # The emulator stores data per-project, so we'll try common names
+    common_projects = [
+        'test-project',
+        'dev-project', 
+        'local-dev',
+        'emulator-project',
+        'mephysio-hrd-local',
+        'me-physio-hrd',
+    ]
+    
+    projects = []
+    for proj in common_projects:
+        try:
+            # Try to connect to each project
+            client = get_client(proj)
+            query = client.query()
+            query.keys_only()
+            # Don't retry: a missing emulator should not stall the scan
+            entities = list(query.fetch(limit=1, retry=NO_RETRY, timeout=5))
+            # If we can fetch at least one entity, project has data
+            if entities:
+                projects.append(proj)
+        except Exception:
+            # Project doesn't exist or has no data
+            pass
+    
+    with _cache_lock:
+        _project_scan['projects'] = projects
+        _project_scan['expires'] = time.monotonic() + PROJECT_SCAN_TTL
+    return projects
+
+def get_kinds(client):
+    """Get the kinds of a client's project, cached for KIND_CACHE_TTL seconds"""
+    with _cache_lock:
+        cached = _kind_cache.get(client)
+        if cached is not None and time.monotonic() < cached[0]:
+            return cached[1]
+    
+    kinds = list_kinds(client)
+    with _cache_lock:
+        _kind_cache[client] = (time.monotonic() + KIND_CACHE_TTL, kinds)
+    return kinds
+
+def invalidate_kinds(client):
+    """Forget the cached kinds of a client after it creates or deletes entities"""
+    with _cache_lock:
+        _kind_cache.pop(client, None)
+
+def warm_up():
+    """Create the default client and fill the project and kind caches
+    
+    Called by serve.py when a worker boots, so the first request does not
+    pay for client setup and the emulator project scan.
+    """
+    # Browsing a snapshot offline must not wait on an emulator that isn't there
+    if os.getenv('OFFLINE_SNAPSHOT'):
+        return
+    client = get_client(os.getenv('GOOGLE_CLOUD_PROJECT', 'test-project'))
+    scan_projects(refresh=True)
+    try:
+        get_kinds(client)
+    except Exception:
+        # The emulator may still be starting; the first request will retry
+        pass
 
 def get_property_type(value):
     """Get the type name of a property value"""
@@ -99,6 +227,8 @@ def get_property_type(value):
         return 'object'
     elif isinstance(value, datetime):
         return 'datetime'
+    elif isinstance(value, datastore.Key):
+        return 'key'
     else:
         # Check for other blob-like types from Google Cloud
         type_name = type(value).__name__
@@ -188,6 +318,9 @@ def format_value_for_form(value):
 # Initialize NDB client
 def create_ndb_client():
     """Create and return an NDB client for the emulator"""
+    # Imported here because google.cloud.ndb is slow to import and rarely used
+    from google.cloud import ndb
+    
     os.environ['DATASTORE_EMULATOR_HOST'] = os.getenv('DATASTORE_EMULATOR_HOST', 'localhost:8081')
     os.environ['GOOGLE_CLOUD_PROJECT'] = os.getenv('GOOGLE_CLOUD_PROJECT', 'me-physio-hrd')
 
@@ -197,38 +330,198 @@ def create_ndb_client():
 # Initialize Datastore client for direct queries
 def create_datastore_client():
     """Create and return a Datastore client for the emulator"""
+    # A snapshot opened for offline browsing replaces the emulator
+    snapshot_client = open_offline_snapshot()
+    if snapshot_client is not None:
+        return snapshot_client
+    
     os.environ['DATASTORE_EMULATOR_HOST'] = os.getenv('DATASTORE_EMULATOR_HOST', 'localhost:8081')
     
     # Use current project from session
     current_project = get_current_project()
     os.environ['GOOGLE_CLOUD_PROJECT'] = current_project
     
-    client = datastore.Client(project=current_project)
-    return client
+    return get_client(current_project)
+
+def cache_scope(client):
+    """Identify the data source a client reads, for cache keys and tags"""
+    # Offline snapshots are identified by file, the emulator by project
+    return getattr(client, 'path', None) or ('emulator', client.project, client.namespace)
+
+def kind_tag(client, kind_name):
+    return ('kind', cache_scope(client), kind_name)
+
+def entity_tag(client, key):
+    return ('entity', cache_scope(client), key.flat_path)
+
+def write_tags(client, key):
+    """Tags of the cached pages a write to key makes stale
+    
+    Besides the key's kind and entity, its ancestors' pages list it as a child.
+    """
+    tags = [kind_tag(client, key.kind)]
+    while key is not None:
+        tags.append(entity_tag(client, key))
+        key = key.parent
+    return tags
+
+def parse_id_or_name(value):
+    """Treat numeric IDs from URLs and forms as IDs, anything else as a name
+    
+    A value in single quotes is always a name, so '1' addresses the name
+    "1" rather than the ID 1.
+    """
+    if len(value) >= 2 and value.startswith("'") and value.endswith("'"):
+        return value[1:-1]
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def format_id_or_name(id_or_name):
+    """Write an ID or name for URLs, quoting names that would read back as IDs"""
+    if isinstance(id_or_name, str) and (id_or_name.startswith("'") or parse_id_or_name(id_or_name) != id_or_name):
+        return f"'{id_or_name}'"
+    return str(id_or_name)
+
+def encode_key_path(flat_path):
+    """Encode a key path for URLs as Kind:id segments joined by '/'"""
+    # Quotes marking numeric names stay readable, e.g. ?parent=User:'1'
+    return '/'.join(quote(str(flat_path[i]), safe='') + ':' + quote(format_id_or_name(flat_path[i + 1]), safe="'")
+                    for i in range(0, len(flat_path), 2))
+
+def decode_key_path(text):
+    """Turn an encoded key path back into a flat path"""
+    flat_path = []
+    for segment in text.split('/'):
+        kind, _, id_or_name = segment.partition(':')
+        flat_path.extend([unquote(kind), parse_id_or_name(unquote(id_or_name))])
+    return flat_path
+
+def entity_key(client, kind_name, entity_id, parent=None):
+    """Build an entity's key from its URL, with the ancestor path from ?parent="""
+    ancestors = decode_key_path(parent) if parent else []
+    return client.key(*ancestors, kind_name, parse_id_or_name(entity_id))
+
+def parent_path(key):
+    """The ?parent= value that addresses key, or None for root entities"""
+    return encode_key_path(key.parent.flat_path) if key.parent else None
+
+def entity_url(key, endpoint='view_entity', **kwargs):
+    """URL of an entity page, including its ancestor path"""
+    return url_for(endpoint, kind_name=key.kind, entity_id=format_id_or_name(key.id_or_name),
+                   parent=parent_path(key), **kwargs)
+
+def format_key_path(key):
+    """Readable key path, e.g. Customer(42) / Order(a1)"""
+    return ' / '.join(f'{key.flat_path[i]}({key.flat_path[i + 1]})' for i in range(0, len(key.flat_path), 2))
+
+def cached_fragment(cache_key):
+    """A cached fragment, unless the page asked to be rendered afresh
+    
+    Live pages reload with ?fresh=1 when the live state contradicts what
+    they show, which may have come from a stale cache entry.
+    """
+    if request.args.get('fresh'):
+        return None
+    return render_cache.get(cache_key)
+
+def cacheable_page(html):
+    """Wrap a rendered page so browsers can revalidate it with an ETag"""
+    response = make_response(html)
+    response.add_etag(weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+async def gather_blocking(*calls):
+    """Run independent blocking datastore calls and return their results in order
+    
+    With CONCURRENT_FETCH on, the calls run at the same time on the bounded
+    datastore executor; otherwise they run one after another like a sync view.
+    Calls run outside the request context, so they must not use the session.
+    """
+    if not app.config.get('CONCURRENT_FETCH'):
+        return [call() for call in calls]
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(loop.run_in_executor(datastore_executor, call) for call in calls))
+
+def project_prefetch():
+    """A call that fills the project scan cache the navbar reads while rendering"""
+    if get_offline_snapshot():
+        return lambda: None
+    return scan_projects
 
 @app.route('/')
-def index():
+async def index():
     """Main page showing all kinds/tables"""
     try:
         client = create_datastore_client()
         
-        # Query for all kinds
-        query = client.query()
-        query.keys_only()
-        
-        kinds = set()
-        for entity in query.fetch():
-            kinds.add(entity.key.kind)
-        
-        kinds = sorted(list(kinds))
+        # Read kinds from the __kind__ catalog instead of scanning every key
+        kinds, _ = await gather_blocking(lambda: get_kinds(client), project_prefetch())
         
         return render_template('index.html', kinds=kinds)
     except Exception as e:
         flash(f'Error connecting to datastore: {str(e)}', 'error')
         return render_template('index.html', kinds=[])
 
+def count_kind(client, kind_name):
+    """Count the entities of a kind (for pagination)"""
+    count_query = client.query(kind=kind_name)
+    count_query.keys_only()
+    results = count_query.fetch()
+    # Snapshot results know their size without decoding any keys
+    if hasattr(results, '__len__'):
+        return len(results)
+    return len(list(results))
+
+def fetch_kind_entities(client, kind_name, page, per_page):
+    """Fetch one page of a kind as display dictionaries"""
+    # Create query for the specific kind
+    query = client.query(kind=kind_name)
+    
+    # Fetch entities with pagination
+    offset = (page - 1) * per_page
+    entities = list(query.fetch(limit=per_page, offset=offset))
+    
+    # Convert entities to dictionaries for display
+    return [entity_row(entity) for entity in entities]
+
+def entity_row(entity):
+    """An entity as a display dictionary for the kind page"""
+    entity_dict = dict(entity)
+    entity_dict['__key__'] = str(entity.key)
+    entity_dict['__id__'] = entity.key.id if entity.key.id else entity.key.name
+    entity_dict['__parent__'] = parent_path(entity.key)
+    # IDs repeat under different parents, so rows are told apart by full path
+    entity_dict['__path__'] = encode_key_path(entity.key.flat_path)
+    return entity_dict
+
+def page_versions(client, kind_name, page, per_page):
+    """Keys and versions of one page of a kind, from a keys-only query
+    
+    A version of 0 means the backend did not report one. Snapshots are
+    read-only, so their entities all report the same version.
+    """
+    offset = (page - 1) * per_page
+    if not hasattr(client, '_datastore_api'):
+        query = client.query(kind=kind_name)
+        query.keys_only()
+        return [(entity.key, 1) for entity in query.fetch(limit=per_page, offset=offset)]
+    
+    results = []
+    cursor = None
+    while len(results) < per_page:
+        batch = run_query(client, kind_name, cursor, limit=per_page - len(results), offset=offset, keys_only=True)
+        offset = max(0, offset - batch.skipped_results)
+        results.extend(batch.entity_results)
+        if batch.more_results != query_pb2.QueryResultBatch.MoreResultsType.NOT_FINISHED:
+            break
+        cursor = batch.end_cursor
+    return [(helpers.key_from_protobuf(result.entity.key), result.version) for result in results]
+
 @app.route('/kind/<kind_name>')
-def browse_kind(kind_name):
+async def browse_kind(kind_name):
     """Browse entities of a specific kind"""
     try:
         client = create_datastore_client()
@@ -237,86 +530,297 @@ def browse_kind(kind_name):
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
         
-        # Create query for the specific kind
-        query = client.query(kind=kind_name)
-        
-        # Count total entities (for pagination)
-        count_query = client.query(kind=kind_name)
-        count_query.keys_only()
-        total_count = len(list(count_query.fetch()))
-        
-        # Fetch entities with pagination
-        offset = (page - 1) * per_page
-        entities = list(query.fetch(limit=per_page, offset=offset))
-        
-        # Convert entities to dictionaries for display
-        entity_data = []
-        for entity in entities:
-            entity_dict = dict(entity)
-            entity_dict['__key__'] = str(entity.key)
-            entity_dict['__id__'] = entity.key.id if entity.key.id else entity.key.name
-            entity_data.append(entity_dict)
-        
-        # Calculate pagination info
-        total_pages = (total_count + per_page - 1) // per_page
-        has_prev = page > 1
-        has_next = page < total_pages
+        cache_key = ('browse_kind', cache_scope(client), kind_name, page, per_page,
+                     tuple(sorted((name, value) for name, value in request.args.items() if name != 'fresh')))
+        content = cached_fragment(cache_key)
+        if content is None:
+            # The count, the page and the navbar's project list are independent
+            entity_data, total_count, _ = await gather_blocking(
+                lambda: fetch_kind_entities(client, kind_name, page, per_page),
+                lambda: count_kind(client, kind_name),
+                project_prefetch())
+            
+            # Calculate pagination info
+            total_pages = (total_count + per_page - 1) // per_page
+            has_prev = page > 1
+            has_next = page < total_pages
+            
+            content = render_template('browse_kind_content.html', 
+                                    kind_name=kind_name,
+                                    entities=entity_data,
+                                    page=page,
+                                    per_page=per_page,
+                                    total_count=total_count,
+                                    total_pages=total_pages,
+                                    has_prev=has_prev,
+                                    has_next=has_next)
+            render_cache.put(cache_key, content, tags=[kind_tag(client, kind_name)])
         
-        return render_template('browse_kind.html', 
-                             kind_name=kind_name,
-                             entities=entity_data,
-                             page=page,
-                             per_page=per_page,
-                             total_count=total_count,
-                             total_pages=total_pages,
-                             has_prev=has_prev,
-                             has_next=has_next)
+        return cacheable_page(render_template('browse_kind.html',
+                                              kind_name=kind_name,
+                                              content=Markup(content)))
     except Exception as e:
         flash(f'Error browsing {kind_name}: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+def property_keys(values):
+    """Complete keys among property values, including keys inside arrays"""
+    keys = []
+    for value in values:
+        for item in (value if isinstance(value, list) else [value]):
+            if isinstance(item, datastore.Key) and not item.is_partial:
+                keys.append(item)
+    return keys
+
+def referenced_keys(entity):
+    """Keys an entity points at: its Key-valued properties and its ancestors"""
+    keys = property_keys(entity.values())
+    parent = entity.key.parent
+    while parent is not None:
+        keys.append(parent)
+        parent = parent.parent
+    return keys
+
+def summarize_entity(entity, properties=3, width=40):
+    """One-line summary of an entity's first few properties"""
+    parts = []
+    for name, value in list(entity.items())[:properties]:
+        text = ' '.join(format_value(value).split())
+        if len(text) > width:
+            text = text[:width - 3] + '...'
+        parts.append(f'{name}: {text}')
+    return ' · '.join(parts)
+
+def resolve_references(client, keys):
+    """Look up referenced entities in one batched get_multi
+    
+    Returns {flat_path: summary} for every key that was looked up; the summary
+    is None if the entity does not exist. Keys of other projects or
+    namespaces can't be read through this client and are left out.
+    """
+    lookup = {}
+    for key in keys:
+        if key.project == client.project and key.namespace == client.namespace:
+            lookup.setdefault(key.flat_path, key)
+    lookup_keys = list(lookup.values())[:REFERENCE_LOOKUP_LIMIT]
+    if not lookup_keys:
+        return {}
+    
+    references = {key.flat_path: None for key in lookup_keys}
+    for entity in client.get_multi(lookup_keys):
+        references[entity.key.flat_path] = summarize_entity(entity)
+    return references
+
+def fetch_children(client, key, cursor=None, per_page=CHILDREN_PER_PAGE):
+    """One page of an entity's descendants (any kind) and the cursor of the next page"""
+    # Ancestor queries include the ancestor itself, which comes first
+    limit = per_page if cursor else per_page + 1
+    query = client.query(ancestor=key)
+    query_iter = query.fetch(start_cursor=cursor, limit=limit)
+    page = list(next(query_iter.pages, []))
+    
+    next_cursor = query_iter.next_page_token if len(page) == limit else None
+    if isinstance(next_cursor, bytes):
+        next_cursor = next_cursor.decode('ascii')
+    
+    children = [{'key': child.key, 'summary': summarize_entity(child)}
+                for child in page if child.key.flat_path != key.flat_path]
+    return children, next_cursor
+
 @app.route('/kind/<kind_name>/entity/<entity_id>')
-def view_entity(kind_name, entity_id):
+async def view_entity(kind_name, entity_id):
     """View a specific entity"""
     try:
         client = create_datastore_client()
+        parent = request.args.get('parent')
+        children_cursor = request.args.get('children_cursor')
+        key = entity_key(client, kind_name, entity_id, parent)
         
-        # Try to parse entity_id as int, fallback to string
-        try:
-            key = client.key(kind_name, int(entity_id))
-        except ValueError:
-            key = client.key(kind_name, entity_id)
-        
-        entity = client.get(key)
-        
-        if entity is None:
-            flash(f'Entity not found: {entity_id}', 'error')
-            return redirect(url_for('browse_kind', kind_name=kind_name))
-        
-        entity_dict = dict(entity)
-        entity_dict['__key__'] = str(entity.key)
-        entity_dict['__id__'] = entity.key.id if entity.key.id else entity.key.name
-        entity_dict['__kind__'] = entity.key.kind
+        cache_key = ('view_entity', cache_scope(client), key.flat_path, children_cursor)
+        content = cached_fragment(cache_key)
+        if content is None:
+            # The entity and its children don't depend on each other
+            entity, (children, next_cursor), _ = await gather_blocking(
+                lambda: client.get(key),
+                lambda: fetch_children(client, key, children_cursor),
+                project_prefetch())
+            
+            if entity is None:
+                flash(f'Entity not found: {format_key_path(key)}', 'error')
+                return redirect(url_for('browse_kind', kind_name=kind_name))
+            
+            # Everything the entity points at, ancestors included, in one lookup
+            keys = referenced_keys(entity)
+            references = resolve_references(client, keys)
+            ancestors = []
+            ancestor = key.parent
+            while ancestor is not None:
+                ancestors.insert(0, ancestor)
+                ancestor = ancestor.parent
+            
+            entity_dict = dict(entity)
+            entity_dict['__key__'] = str(entity.key)
+            entity_dict['__id__'] = entity.key.id if entity.key.id else entity.key.name
+            entity_dict['__kind__'] = entity.key.kind
+            
+            content = render_template('view_entity_content.html', 
+                                    kind_name=kind_name,
+                                    entity_id=entity_id,
+                                    parent=parent,
+                                    entity_key=entity.key,
+                                    entity=entity_dict,
+                                    references=references,
+                                    ancestors=ancestors,
+                                    children=children,
+                                    children_cursor=children_cursor,
+                                    next_children_cursor=next_cursor)
+            # Referenced entities are summarized inline, so their writes drop this page too
+            render_cache.put(cache_key, content,
+                             tags=[entity_tag(client, key)] + [entity_tag(client, ref) for ref in keys])
         
-        return render_template('view_entity.html', 
-                             kind_name=kind_name,
-                             entity_id=entity_id,
-                             entity=entity_dict)
+        return cacheable_page(render_template('view_entity.html',
+                                              kind_name=kind_name,
+                                              entity_id=entity_id,
+                                              parent=parent,
+                                              content=Markup(content)))
     except Exception as e:
         flash(f'Error viewing entity: {str(e)}', 'error')
         return redirect(url_for('browse_kind', kind_name=kind_name))
 
+# Seconds between keep-alive comments on idle live streams
+LIVE_KEEPALIVE = 15
+# Seconds between recounts of a watched kind, unless its page changes shape
+LIVE_COUNT_INTERVAL = float(os.getenv('LIVE_COUNT_INTERVAL', 30))
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+
+def stream_live_feed(watch_key, poll, render_diff):
+    """Stream diffs of a shared watch to this client as Server-Sent Events"""
+    def generate():
+        # Subscribe once streaming starts, so a stream that the server turns
+        # away before sending anything never joins the watch
+        subscriber = live_feed.subscribe(watch_key, poll)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = subscriber.get(timeout=LIVE_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if 'error' in event:
+                    yield sse_event('error', event)
+                else:
+                    yield sse_event('diff', render_diff(event))
+        finally:
+            live_feed.unsubscribe(watch_key, subscriber)
+    
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/kind/<kind_name>/live')
+def browse_kind_live(kind_name):
+    """Live row diffs for a page of a kind"""
+    client = create_datastore_client()
+    page = int(request.args.get('page', 1))
+    per_page = int(request.args.get('per_page', 20))
+    
+    # Rows by key path with the version they were fetched at, and the last count
+    known = {}
+    counted = {'total_count': None, 'at': 0.0}
+    
+    def poll():
+        # Keys and versions are cheap; only new or changed entities are fetched
+        versions = page_versions(client, kind_name, page, per_page)
+        page_paths = {key.flat_path for key, _ in versions}
+        reshaped = page_paths != set(known)
+        stale = [key for key, version in versions
+                 if not version or known.get(key.flat_path, (None,))[0] != version]
+        fetched = {entity.key.flat_path: entity for entity in client.get_multi(stale)} if stale else {}
+        stale_paths = {key.flat_path for key in stale}
+        
+        for flat_path in set(known) - page_paths:
+            del known[flat_path]
+        rows = {}
+        for key, version in versions:
+            if key.flat_path in fetched:
+                known[key.flat_path] = (version, entity_row(fetched[key.flat_path]))
+            elif key.flat_path in stale_paths or key.flat_path not in known:
+                known.pop(key.flat_path, None)
+                continue  # Deleted since the keys-only query
+            entity = known[key.flat_path][1]
+            rows[entity['__path__']] = (content_hash(entity), entity)
+        
+        # Recount when rows come or go, otherwise only now and then
+        if reshaped or time.monotonic() - counted['at'] >= LIVE_COUNT_INTERVAL:
+            counted['total_count'] = count_kind(client, kind_name)
+            counted['at'] = time.monotonic()
+        return rows, {'total_count': counted['total_count']}
+    
+    def render_diff(event):
+        if not event.get('full'):
+            # Someone else wrote to this kind, so cached pages are stale too
+            render_cache.invalidate(kind_tag(client, kind_name))
+        return {
+            'full': event.get('full', False),
+            'added': {row_id: render_template('browse_kind_row.html', entity=entity, kind_name=kind_name)
+                      for row_id, entity in event['added'].items()},
+            'changed': {row_id: render_template('browse_kind_row.html', entity=entity, kind_name=kind_name)
+                        for row_id, entity in event['changed'].items()},
+            'removed': event['removed'],
+            'order': event['order'],
+            'total_count': event['meta']['total_count'],
+        }
+    
+    return stream_live_feed(('browse_kind', cache_scope(client), kind_name, page, per_page), poll, render_diff)
+
+@app.route('/kind/<kind_name>/entity/<entity_id>/live')
+def view_entity_live(kind_name, entity_id):
+    """Live property diffs for an entity"""
+    client = create_datastore_client()
+    key = entity_key(client, kind_name, entity_id, request.args.get('parent'))
+    
+    def poll():
+        entity = client.get(key)
+        if entity is None:
+            return {}, {'exists': False}
+        rows = {name: (content_hash(value), value) for name, value in entity.items()}
+        return rows, {'exists': True}
+    
+    def render_diff(event):
+        if not event.get('full'):
+            render_cache.invalidate(entity_tag(client, key))
+        # Resolve the keys in new or changed values, again in one lookup
+        values = list(event['added'].values()) + list(event['changed'].values())
+        references = resolve_references(client, property_keys(values))
+        return {
+            'full': event.get('full', False),
+            'added': {name: render_template('view_entity_property.html', key=name, value=value, references=references)
+                      for name, value in event['added'].items()},
+            'changed': {name: render_template('view_entity_property.html', key=name, value=value, references=references)
+                        for name, value in event['changed'].items()},
+            'removed': event['removed'],
+            'order': event['order'],
+            'exists': event['meta']['exists'],
+        }
+    
+    return stream_live_feed(('view_entity', cache_scope(client), key.flat_path), poll, render_diff)
+
+@app.route('/api/live-stats')
+def api_live_stats():
+    """API endpoint to get the shared polling loops of live pages"""
+    return jsonify(live_feed.stats())
+
 @app.route('/kind/<kind_name>/entity/<entity_id>/edit', methods=['GET', 'POST'])
 def edit_entity(kind_name, entity_id):
     """Edit a specific entity"""
     try:
         client = create_datastore_client()
-        
-        # Try to parse entity_id as int, fallback to string
-        try:
-            key = client.key(kind_name, int(entity_id))
-        except ValueError:
-            key = client.key(kind_name, entity_id)
+        parent = request.args.get('parent')
+        key = entity_key(client, kind_name, entity_id, parent)
         
         if request.method == 'GET':
             entity = client.get(key)
@@ -332,6 +836,7 @@ def edit_entity(kind_name, entity_id):
             return render_template('edit_entity.html', 
                                  kind_name=kind_name,
                                  entity_id=entity_id,
+                                 parent=parent,
                                  entity=entity_dict)
         
         elif request.method == 'POST':
@@ -366,9 +871,10 @@ def edit_entity(kind_name, entity_id):
             
             # Save the entity
             client.put(entity)
+            render_cache.invalidate(*write_tags(client, key))
             
             flash(f'Entity {entity_id} updated successfully!', 'success')
-            return redirect(url_for('view_entity', kind_name=kind_name, entity_id=entity_id))
+            return redirect(url_for('view_entity', kind_name=kind_name, entity_id=entity_id, parent=parent))
     
     except Exception as e:
         flash(f'Error editing entity: {str(e)}', 'error')
@@ -389,10 +895,7 @@ def new_entity(kind_name):
             
             # Create key
             if entity_id:
-                try:
-                    key = client.key(kind_name, int(entity_id))
-                except ValueError:
-                    key = client.key(kind_name, entity_id)
+                key = client.key(kind_name, parse_id_or_name(entity_id))
             else:
                 key = client.key(kind_name)
             
@@ -415,10 +918,12 @@ def new_entity(kind_name):
             
             # Save the entity
             client.put(entity)
+            invalidate_kinds(client)
             
             actual_id = entity.key.id if entity.key.id else entity.key.name
+            render_cache.invalidate(*write_tags(client, entity.key))
             flash(f'Entity created successfully with ID: {actual_id}', 'success')
-            return redirect(url_for('view_entity', kind_name=kind_name, entity_id=actual_id))
+            return redirect(entity_url(entity.key))
     
     except Exception as e:
         flash(f'Error creating entity: {str(e)}', 'error')
@@ -429,15 +934,12 @@ def delete_entity(kind_name, entity_id):
     """Delete a specific entity"""
     try:
         client = create_datastore_client()
-        
-        # Try to parse entity_id as int, fallback to string
-        try:
-            key = client.key(kind_name, int(entity_id))
-        except ValueError:
-            key = client.key(kind_name, entity_id)
+        key = entity_key(client, kind_name, entity_id, request.args.get('parent'))
         
         # Delete the entity
         client.delete(key)
+        invalidate_kinds(client)
+        render_cache.invalidate(*write_tags(client, key))
         
         flash(f'Entity {entity_id} deleted successfully!', 'success')
         return redirect(url_for('browse_kind', kind_name=kind_name))
@@ -452,14 +954,7 @@ def api_kinds():
     try:
         client = create_datastore_client()
         
-        query = client.query()
-        query.keys_only()
-        
-        kinds = set()
-        for entity in query.fetch():
-            kinds.add(entity.key.kind)
-        
-        return jsonify(list(kinds))
+        return jsonify(get_kinds(client))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -491,14 +986,54 @@ def format_value(value):
 app.jinja_env.filters['format_value'] = format_value
 app.jinja_env.filters['get_type'] = get_property_type
 app.jinja_env.filters['format_for_form'] = format_value_for_form
+app.jinja_env.filters['key_path'] = format_key_path
+app.jinja_env.filters['content_hash'] = content_hash
+app.jinja_env.filters['url_id'] = format_id_or_name
+app.jinja_env.tests['datastore_key'] = lambda value: isinstance(value, datastore.Key)
+app.jinja_env.globals['entity_url'] = entity_url
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/plain', 'text/css', 'application/json', 'application/javascript'}
+COMPRESS_MIN_SIZE = 512
+
+@app.after_request
+def compress_response(response):
+    """Compress HTML and JSON responses with brotli or gzip when enabled"""
+    if not app.config.get('COMPRESS_RESPONSES'):
+        return response
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(data, quality=4))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 # Context processor to add project info to all templates
 @app.context_processor
 def inject_project_info():
     """Inject current project and available projects into all templates"""
+    snapshot_client = open_offline_snapshot()
+    if snapshot_client is not None:
+        return {
+            'current_project': snapshot_client.project,
+            'available_projects': [snapshot_client.project],
+            'offline_snapshot': os.path.basename(snapshot_client.path)
+        }
     return {
         'current_project': get_current_project(),
-        'available_projects': get_available_projects()
+        'available_projects': get_available_projects(),
+        'offline_snapshot': None
     }
 
 @app.route('/switch-project', methods=['POST'])
@@ -542,10 +1077,180 @@ def refresh_projects():
         del session['known_projects']
     
     # Force a new scan by calling get_available_projects
+    scan_projects(refresh=True)
     projects = get_available_projects()
     
     flash(f'Refreshed project list - found {len(projects)} projects', 'success')
     return redirect(url_for('index'))
 
+FILTER_OPERATORS = ('>=', '<=', '!=', '=', '>', '<')
+
+def parse_filter_lines(text):
+    """Parse 'property operator value' lines into query filters"""
+    filters = []
+    for line in (text or '').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        for op in FILTER_OPERATORS:
+            if op in line:
+                prop, raw_value = line.split(op, 1)
+                break
+        else:
+            raise ValueError(f'No operator found in filter: {line}')
+        
+        prop = prop.strip()
+        raw_value = raw_value.strip()
+        try:
+            # Numbers, booleans, null and quoted strings are given as JSON
+            value = json.loads(raw_value)
+        except json.JSONDecodeError:
+            value = raw_value
+        filters.append((prop, op, value))
+    return filters
+
+@app.route('/copy', methods=['GET', 'POST'])
+def copy_kind():
+    """Copy a kind between projects/namespaces as a background job"""
+    if request.method == 'GET':
+        return render_template('copy_kind.html',
+                             kind_name=request.args.get('kind', ''),
+                             jobs=list_copy_jobs(),
+                             max_batch_size=MAX_BATCH_SIZE,
+                             max_workers=MAX_WORKERS)
+    
+    kind_name = request.form.get('kind', '').strip()
+    try:
+        source_project = request.form.get('source_project') or get_current_project()
+        target_project = request.form.get('target_project', '').strip()
+        if not kind_name or not target_project:
+            raise ValueError('Kind and target project are required')
+        
+        job = start_copy_job(
+            source_project=source_project,
+            source_namespace=request.form.get('source_namespace', '').strip(),
+            kind=kind_name,
+            target_project=target_project,
+            target_namespace=request.form.get('target_namespace', '').strip(),
+            target_kind=request.form.get('target_kind', '').strip(),
+            key_prefix=request.form.get('key_prefix', ''),
+            filters=parse_filter_lines(request.form.get('filters')),
+            batch_size=int(request.form.get('batch_size') or MAX_BATCH_SIZE),
+            workers=int(request.form.get('workers') or 4),
+        )
+        flash(f'Started copy job {job.id}: {job.source} → {job.target}', 'success')
+    except Exception as e:
+        flash(f'Error starting copy: {str(e)}', 'error')
+    return redirect(url_for('copy_kind', kind=kind_name))
+
+@app.route('/copy/<job_id>/stop', methods=['POST'])
+def stop_copy_job(job_id):
+    """Stop a running copy job at the next page boundary"""
+    job = get_copy_job(job_id)
+    if job is None:
+        flash(f'Copy job not found: {job_id}', 'error')
+    else:
+        job.stop()
+        flash(f'Stopping copy job {job_id}', 'success')
+    return redirect(url_for('copy_kind'))
+
+@app.route('/copy/<job_id>/resume', methods=['POST'])
+def resume_copy_job(job_id):
+    """Resume a stopped or failed copy job from its last checkpoint"""
+    job = get_copy_job(job_id)
+    if job is None:
+        flash(f'Copy job not found: {job_id}', 'error')
+    elif not job.can_resume:
+        flash(f'Copy job {job_id} is {job.status} and cannot be resumed', 'error')
+    else:
+        job.start()
+        flash(f'Resumed copy job {job_id} after {job.copied} entities', 'success')
+    return redirect(url_for('copy_kind'))
+
+@app.route('/api/cache-stats')
+def api_cache_stats():
+    """API endpoint to get hit/miss rates of the rendered-fragment cache"""
+    return jsonify(render_cache.stats())
+
+@app.route('/api/copy-jobs')
+def api_copy_jobs():
+    """API endpoint to get progress of all copy jobs"""
+    return jsonify([job.to_dict() for job in list_copy_jobs()])
+
+@app.route('/api/copy-jobs/<job_id>')
+def api_copy_job(job_id):
+    """API endpoint to get progress of one copy job"""
+    job = get_copy_job(job_id)
+    if job is None:
+        return jsonify({'error': f'Copy job not found: {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/snapshots', methods=['GET', 'POST'])
+def snapshots():
+    """List snapshot files and take a snapshot of the current project"""
+    if request.method == 'POST':
+        if get_offline_snapshot():
+            flash('Close the offline snapshot before taking a snapshot', 'error')
+            return redirect(url_for('snapshots'))
+        try:
+            job = start_snapshot_job('snapshot', get_current_project(),
+                                     namespace=request.form.get('namespace', '').strip())
+            flash(f'Started snapshot of {job.project} to {job.filename}', 'success')
+        except Exception as e:
+            flash(f'Error starting snapshot: {str(e)}', 'error')
+        return redirect(url_for('snapshots'))
+    
+    try:
+        snapshot_files = list_snapshots()
+    except Exception as e:
+        flash(f'Error listing snapshots: {str(e)}', 'error')
+        snapshot_files = []
+    return render_template('snapshots.html',
+                         snapshots=snapshot_files,
+                         jobs=list_snapshot_jobs())
+
+@app.route('/snapshots/<filename>/restore', methods=['POST'])
+def restore_snapshot(filename):
+    """Replace the current project's data with a snapshot"""
+    # The pages show the snapshot's project while offline, not the one restored into
+    if get_offline_snapshot():
+        flash('Close the offline snapshot before restoring', 'error')
+        return redirect(url_for('snapshots'))
+    try:
+        job = start_snapshot_job('restore', get_current_project(),
+                                 namespace=request.form.get('namespace', '').strip(),
+                                 filename=filename)
+        flash(f'Started restoring {job.filename} into {job.project}', 'success')
+    except Exception as e:
+        flash(f'Error starting restore: {str(e)}', 'error')
+    return redirect(url_for('snapshots'))
+
+@app.route('/snapshots/<filename>/browse', methods=['POST'])
+def browse_snapshot(filename):
+    """Browse a snapshot file read-only, without the emulator"""
+    from flask import session
+    
+    path = os.path.join(get_snapshot_dir(), os.path.basename(filename))
+    try:
+        client = open_snapshot(path)
+        session['offline_snapshot'] = path
+        flash(f'Browsing {filename} offline ({client.count} entities, read-only)', 'success')
+        return redirect(url_for('index'))
+    except Exception as e:
+        flash(f'Error opening snapshot: {str(e)}', 'error')
+        return redirect(url_for('snapshots'))
+
+@app.route('/offline/close', methods=['POST'])
+def close_snapshot():
+    """Stop browsing a snapshot and go back to the emulator"""
+    close_offline_snapshot()
+    flash(f'Back to the emulator, project: {get_current_project()}', 'success')
+    return redirect(url_for('index'))
+
+@app.route('/api/snapshot-jobs')
+def api_snapshot_jobs():
+    """API endpoint to get progress of snapshot and restore jobs"""
+    return jsonify([job.to_dict() for job in list_snapshot_jobs()])
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
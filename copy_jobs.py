@@ -0,0 +1,261 @@
+"""
+Background kind copy jobs for the Local Datastore Browser
+
+A copy job streams one kind out of a source project/namespace page by page
+using query cursors, and writes each page into a target project/namespace
+with put_multi. Writes run concurrently on a small thread pool while the
+next page is being read. The job keeps a checkpoint cursor that only moves
+past a page once that page and every page before it has been written, so a
+failed or stopped job can be resumed without losing or skipping entities.
+"""
+
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from google.cloud import datastore
+from google.cloud.datastore.query import PropertyFilter
+
+from datastore_clients import get_client
+
+# Datastore accepts at most 500 entities per commit
+MAX_BATCH_SIZE = 500
+# Concurrent put_multi calls per job
+MAX_WORKERS = 32
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class CopyKindJob:
+    """Copy every entity of a kind from one project/namespace to another"""
+
+    def __init__(self, source_project, kind, target_project,
+                 source_namespace=None, target_namespace=None,
+                 target_kind=None, key_prefix='', filters=None,
+                 batch_size=MAX_BATCH_SIZE, workers=4):
+        self.id = uuid.uuid4().hex[:12]
+        self.source_project = source_project
+        self.source_namespace = source_namespace or None
+        self.kind = kind
+        self.target_project = target_project
+        self.target_namespace = target_namespace or None
+        self.target_kind = target_kind or kind
+        self.key_prefix = key_prefix or ''
+        self.filters = list(filters or [])
+        self.batch_size = max(1, min(int(batch_size), MAX_BATCH_SIZE))
+        self.workers = max(1, min(int(workers), MAX_WORKERS))
+
+        # Within one partition the copies would land in the kind being read,
+        # and prefixed names sort after the cursor and get copied again
+        if (self.source_project == self.target_project and self.source_namespace == self.target_namespace
+                and self.target_kind == self.kind):
+            raise ValueError('Source and target are the same kind; set a different target or kind')
+
+        self.status = 'pending'
+        self.error = None
+        self.cursor = None
+        self.copied = 0
+        self.batches = 0
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self._elapsed_before_run = 0.0
+        self._stop_requested = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def source(self):
+        return self._describe(self.source_project, self.source_namespace, self.kind)
+
+    @property
+    def target(self):
+        return self._describe(self.target_project, self.target_namespace, self.target_kind)
+
+    @staticmethod
+    def _describe(project, namespace, kind):
+        if namespace:
+            return f'{project}/{namespace}/{kind}'
+        return f'{project}/{kind}'
+
+    @property
+    def elapsed(self):
+        """Seconds spent copying, across all runs of the job"""
+        elapsed = self._elapsed_before_run
+        if self.started_at is not None:
+            end = self.finished_at or datetime.now()
+            elapsed += (end - self.started_at).total_seconds()
+        return elapsed
+
+    @property
+    def throughput(self):
+        """Entities written per second"""
+        elapsed = self.elapsed
+        return self.copied / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def is_running(self):
+        return self.status in ('pending', 'running')
+
+    @property
+    def can_resume(self):
+        return self.status in ('failed', 'stopped')
+
+    def start(self):
+        """Run the copy in a background thread, continuing from the checkpoint"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self.started_at is not None:
+                self._elapsed_before_run = self.elapsed
+            self._stop_requested.clear()
+            self.status = 'running'
+            self.error = None
+            self.started_at = datetime.now()
+            self.finished_at = None
+            self._thread = threading.Thread(target=self._run, name=f'copy-{self.id}', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ask the job to stop after the pages already in flight are written"""
+        self._stop_requested.set()
+
+    def _build_query(self, client):
+        query = client.query(kind=self.kind)
+        for prop, op, value in self.filters:
+            query.add_filter(filter=PropertyFilter(prop, op, value))
+        return query
+
+    def _rewrite_key(self, key, client):
+        """Map a source key onto the target project and namespace
+        
+        Every element moves to the target partition, ancestors included,
+        but only elements of the copied kind are renamed and prefixed.
+        """
+        path = []
+        for element in key.path:
+            kind = element['kind']
+            copied = kind == self.kind
+            path.append(self.target_kind if copied else kind)
+            if 'id' in element:
+                path.append(element['id'])
+            elif 'name' in element:
+                path.append(self.key_prefix + element['name'] if copied else element['name'])
+        return client.key(*path)
+
+    def _rewrite_value(self, value, client):
+        """Point Key-valued properties at the target project as well"""
+        if isinstance(value, datastore.Key):
+            if value.project == self.source_project and value.namespace == self.source_namespace:
+                return self._rewrite_key(value, client)
+            return value
+        if isinstance(value, datastore.Entity):
+            nested = datastore.Entity(
+                key=value.key, exclude_from_indexes=tuple(value.exclude_from_indexes))
+            for name, item in value.items():
+                nested[name] = self._rewrite_value(item, client)
+            return nested
+        if isinstance(value, list):
+            return [self._rewrite_value(item, client) for item in value]
+        return value
+
+    def _convert(self, entity, client):
+        copy = datastore.Entity(
+            key=self._rewrite_key(entity.key, client),
+            exclude_from_indexes=tuple(entity.exclude_from_indexes))
+        for name, value in entity.items():
+            copy[name] = self._rewrite_value(value, client)
+        return copy
+
+    def _write_page(self, entities):
+        client = get_client(self.target_project, self.target_namespace)
+        client.put_multi([self._convert(entity, client) for entity in entities])
+        return len(entities)
+
+    def _run(self):
+        source = get_client(self.source_project, self.source_namespace)
+        query = self._build_query(source)
+        # Pages queued for writing, oldest first, with the cursor after each
+        in_flight = []
+        max_in_flight = self.workers * 2
+
+        def commit_oldest():
+            future, next_cursor = in_flight.pop(0)
+            written = future.result()
+            with self._lock:
+                self.copied += written
+                self.batches += 1
+                self.cursor = next_cursor
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers,
+                                    thread_name_prefix=f'copy-{self.id}') as executor:
+                cursor = self.cursor
+                while not self._stop_requested.is_set():
+                    query_iter = query.fetch(start_cursor=cursor, limit=self.batch_size)
+                    page = next(query_iter.pages, None)
+                    entities = list(page) if page is not None else []
+                    if not entities:
+                        break
+
+                    cursor = query_iter.next_page_token
+                    in_flight.append((executor.submit(self._write_page, entities), cursor))
+
+                    # Keep memory bounded and the checkpoint moving
+                    while len(in_flight) >= max_in_flight or (in_flight and in_flight[0][0].done()):
+                        commit_oldest()
+
+                    if cursor is None:
+                        break
+
+                while in_flight:
+                    commit_oldest()
+
+            self.status = 'stopped' if self._stop_requested.is_set() else 'completed'
+        except Exception as e:
+            # Pages after the checkpoint are written again on resume, which
+            # is safe because put_multi overwrites by key
+            for future, _ in in_flight:
+                future.cancel()
+            self.status = 'failed'
+            self.error = str(e)
+        finally:
+            self.finished_at = datetime.now()
+
+    def to_dict(self):
+        """Progress report for the JSON API"""
+        return {
+            'id': self.id,
+            'source': self.source,
+            'target': self.target,
+            'status': self.status,
+            'error': self.error,
+            'copied': self.copied,
+            'batches': self.batches,
+            'elapsed_seconds': round(self.elapsed, 2),
+            'entities_per_second': round(self.throughput, 1),
+            'resumable': self.can_resume,
+        }
+
+
+def start_copy_job(**options):
+    """Create, register and start a copy job"""
+    job = CopyKindJob(**options)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.start()
+    return job
+
+
+def get_copy_job(job_id):
+    """Look up a copy job by ID"""
+    return _jobs.get(job_id)
+
+
+def list_copy_jobs():
+    """All known copy jobs, newest first"""
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    return sorted(jobs, key=lambda job: job.created_at, reverse=True)
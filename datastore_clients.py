@@ -0,0 +1,77 @@
+"""
+Per-project Datastore clients for the Local Datastore Browser
+
+Clients are created once per (project, namespace) pair and reused, so code
+that works with several projects at the same time (e.g. copying a kind from
+one project to another) does not have to swap GOOGLE_CLOUD_PROJECT in
+os.environ between calls.
+
+run_query() runs a kind query without converting its results, for code
+that works with raw Entity protobufs or needs entity versions.
+"""
+
+import os
+import threading
+
+from google.cloud import datastore
+from google.cloud.datastore_v1.types import datastore as datastore_pb2
+from google.cloud.datastore_v1.types import entity as entity_pb2
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_emulator_host():
+    """Get the datastore emulator host, making sure the client library sees it"""
+    host = os.getenv('DATASTORE_EMULATOR_HOST', 'localhost:8081')
+    os.environ.setdefault('DATASTORE_EMULATOR_HOST', host)
+    return host
+
+
+def get_client(project, namespace=None):
+    """Get a cached Datastore client bound to a project and namespace"""
+    namespace = namespace or None
+    cache_key = (project, namespace)
+
+    client = _clients.get(cache_key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            get_emulator_host()
+            client = datastore.Client(project=project, namespace=namespace)
+            _clients[cache_key] = client
+    return client
+
+
+def partition_id(client):
+    """The raw PartitionId protobuf of a client's project/namespace"""
+    return entity_pb2.PartitionId.pb()(project_id=client.project,
+                                       database_id=getattr(client, 'database', None) or '',
+                                       namespace_id=client.namespace or '')
+
+
+def run_query(client, kind, cursor=None, limit=None, offset=0, keys_only=False):
+    """Run one batch of a kind query and return the raw QueryResultBatch"""
+    request = datastore_pb2.RunQueryRequest.pb()(project_id=client.project,
+                                                 database_id=getattr(client, 'database', None) or '')
+    request.partition_id.CopyFrom(partition_id(client))
+    request.query.kind.add(name=kind)
+    if keys_only:
+        request.query.projection.add().property.name = '__key__'
+    if limit:
+        request.query.limit.value = limit
+    if offset:
+        request.query.offset = offset
+    if cursor:
+        request.query.start_cursor = cursor
+    response = client._datastore_api.run_query(request=datastore_pb2.RunQueryRequest.wrap(request))
+    return datastore_pb2.RunQueryResponse.pb(response).batch
+
+
+def clear_clients():
+    """Forget all cached clients"""
+    with _clients_lock:
+        _clients.clear()
@@ -0,0 +1,166 @@
+"""
+Live change feed for the Local Datastore Browser
+
+Browse and view pages can subscribe to a Server-Sent Events stream instead of
+being reloaded. Every open page watching the same thing (the same kind page
+of the same data source, or the same entity) shares one Watch. The watch
+polls on a single background thread while anyone is subscribed and sends only
+row-level differences to each subscriber:
+
+    {'added': {row_id: row}, 'changed': {row_id: row}, 'removed': [row_id],
+     'order': [row_id, ...], 'meta': {...}}
+
+A poll function returns (rows, meta), where rows maps a row ID to a
+(content hash, row) pair. Rows are compared by hash, so unchanged rows are
+never sent again.
+
+A page may have been rendered (or served from the render cache) before the
+watch's current state, so every subscriber first gets the full state, with
+'full': True and every row under 'added'. The page compares it with the
+hashes of the rows it shows and updates only the rows that differ.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+
+# Seconds between polls of a watched query or entity
+POLL_INTERVAL = float(os.getenv('LIVE_POLL_INTERVAL', 2))
+
+
+def content_hash(value):
+    """Stable hash of an entity's (or property's) content"""
+    data = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def diff_rows(old_rows, new_rows):
+    """Compare two {row_id: (hash, row)} maps"""
+    added = {}
+    changed = {}
+    for row_id, (row_hash, row) in new_rows.items():
+        previous = old_rows.get(row_id)
+        if previous is None:
+            added[row_id] = row
+        elif previous[0] != row_hash:
+            changed[row_id] = row
+    removed = [row_id for row_id in old_rows if row_id not in new_rows]
+    return added, changed, removed
+
+
+class Watch:
+    """One polling loop shared by every subscriber to the same key"""
+
+    def __init__(self, key, poll):
+        self.key = key
+        self.poll = poll
+        self.subscribers = set()
+        self.rows = None
+        self.meta = None
+        self.polls = 0
+        # Held while the state changes and while a subscriber joins, so a
+        # new subscriber's full state and the diffs after it line up
+        self.state_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'live-{key!r}', daemon=True)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                rows, meta = self.poll()
+                self.polls += 1
+                with self.state_lock:
+                    self._publish(rows, meta)
+            except Exception as e:
+                self._broadcast({'error': str(e)})
+            self._stopped.wait(POLL_INTERVAL)
+
+    def full_state(self):
+        """The current rows as a full-state event, or None before the first poll"""
+        rows, meta = self.rows, self.meta
+        if rows is None:
+            return None
+        return {
+            'full': True,
+            'added': {row_id: row for row_id, (_, row) in rows.items()},
+            'changed': {},
+            'removed': [],
+            'order': list(rows),
+            'meta': meta,
+        }
+
+    def _publish(self, rows, meta):
+        if self.rows is None:
+            # Subscribers so far have nothing to diff against yet
+            self.rows, self.meta = rows, meta
+            self._broadcast(self.full_state())
+            return
+
+        added, changed, removed = diff_rows(self.rows, rows)
+        order_changed = list(self.rows) != list(rows)
+        if not (added or changed or removed or order_changed or meta != self.meta):
+            return
+
+        self.rows, self.meta = rows, meta
+        self._broadcast({
+            'added': added,
+            'changed': changed,
+            'removed': removed,
+            'order': list(rows),
+            'meta': meta,
+        })
+
+    def _broadcast(self, event):
+        for subscriber in self.subscribers:
+            subscriber.put(event)
+
+    def stop(self):
+        self._stopped.set()
+
+
+class LiveFeed:
+    """Registry of watches, started on first subscribe and stopped on last unsubscribe"""
+
+    def __init__(self):
+        self._watches = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key, poll):
+        """Subscribe to a key; poll is only used if no one is watching it yet"""
+        subscriber = queue.Queue()
+        with self._lock:
+            watch = self._watches.get(key)
+            if watch is None:
+                watch = Watch(key, poll)
+                self._watches[key] = watch
+                watch._thread.start()
+            with watch.state_lock:
+                # Replace rather than mutate, so the poller can iterate safely
+                watch.subscribers = watch.subscribers | {subscriber}
+                state = watch.full_state()
+                if state is not None:
+                    subscriber.put(state)
+        return subscriber
+
+    def unsubscribe(self, key, subscriber):
+        with self._lock:
+            watch = self._watches.get(key)
+            if watch is None:
+                return
+            watch.subscribers = watch.subscribers - {subscriber}
+            if not watch.subscribers:
+                watch.stop()
+                del self._watches[key]
+
+    def stats(self):
+        """Open watches with their subscriber and poll counts"""
+        with self._lock:
+            return [{'key': repr(watch.key),
+                     'subscribers': len(watch.subscribers),
+                     'polls': watch.polls}
+                    for watch in self._watches.values()]
+
+
+live_feed = LiveFeed()
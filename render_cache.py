@@ -0,0 +1,129 @@
+"""
+Rendered-fragment cache for the Local Datastore Browser
+
+Read-heavy pages (browse_kind and view_entity) render their main content
+into an HTML fragment that can be reused for repeated reloads. Entries are:
+
+- keyed by everything the fragment depends on (data source, kind, page,
+  page size, entity ID, ...),
+- tagged with the kind and entity they show, so the app's own writes can
+  drop exactly the fragments they make stale,
+- expired after a short TTL, which bounds staleness from writes made
+  outside the app (tests, scripts, other workers),
+- evicted least-recently-used first once the memory cap is reached.
+
+The cache is off unless RENDER_CACHE is set. Each process has its own
+cache; with several gunicorn workers, only the TTL bounds staleness from
+writes handled by another worker.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class RenderCache:
+    """Size-capped LRU cache of rendered fragments with TTL and tag invalidation"""
+
+    def __init__(self, max_bytes, ttl, enabled=True):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return a cached fragment, or None on a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, tags, expires, _ = entry
+            if time.monotonic() >= expires:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, tags=()):
+        """Store a fragment under a key, tagged for later invalidation"""
+        if not self.enabled:
+            return
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, tuple(tags), time.monotonic() + self.ttl, size)
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        """Drop every fragment carrying any of the given tags"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, tags, _, size = self._entries.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        """Hit/miss counters and current size, for the JSON API"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def create_render_cache():
+    """Create a cache configured from RENDER_CACHE, RENDER_CACHE_MB and RENDER_CACHE_TTL"""
+    return RenderCache(
+        max_bytes=int(os.getenv('RENDER_CACHE_MB', 32)) * 1024 * 1024,
+        ttl=float(os.getenv('RENDER_CACHE_TTL', 10)),
+        enabled=os.getenv('RENDER_CACHE', 'false').lower() in ('1', 'true', 'yes'),
+    )
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Production server for the Local Datastore Browser
+
+`python app.py` runs Flask's development server with the debugger and
+reloader. This script serves the same app without them:
+
+    python serve.py                          # threaded server (default)
+    python serve.py --mode processes         # gunicorn, several worker processes
+    python serve.py loadtest http://localhost:5000/ -c 16 -n 2000
+    python serve.py bench-pages Task         # sequential vs concurrent page fetches
+
+Each worker imports the app, creates its datastore client and fills the
+project and kind caches before taking requests, and reports how long that
+took. Responses are compressed with brotli (if installed) or gzip.
+
+Live pages keep a Server-Sent Events stream open for as long as the tab
+stays open. Those streams do not count against --threads; they have their
+own cap (--live-streams), and a stream over the cap gets a 503, so open
+tabs can never hold up ordinary requests.
+
+Settings can also come from the environment (or .env): SERVER_MODE,
+SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_THREADS,
+SERVER_LIVE_STREAMS.
+"""
+
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Set in each gunicorn worker right after it is forked
+_worker_started = {'at': None}
+
+
+def load_app():
+    """Import, configure and warm up the app; return it with timings"""
+    started = time.perf_counter()
+    os.environ.setdefault('COMPRESS_RESPONSES', 'true')
+    import app as app_module
+    imported = time.perf_counter()
+
+    app_module.app.config['COMPRESS_RESPONSES'] = os.getenv('COMPRESS_RESPONSES', 'true').lower() in ('1', 'true', 'yes')
+    app_module.warm_up()
+    warmed = time.perf_counter()
+
+    return app_module.app, {
+        'import_seconds': imported - started,
+        'warm_up_seconds': warmed - imported,
+    }
+
+
+def _report_ready(label, timings, since):
+    print(f"✅ {label} ready in {time.perf_counter() - since:.2f}s "
+          f"(import {timings['import_seconds']:.2f}s, warm-up {timings['warm_up_seconds']:.2f}s)",
+          flush=True)
+
+
+def limit_requests(app, threads, live_streams):
+    """Wrap a WSGI app to cap requests in progress and open live streams
+    
+    At most `threads` ordinary requests run at once (no cap if None); more
+    wait for a slot. A live stream gives its slot back as soon as it starts
+    and takes one of `live_streams` instead, or gets a 503 if none is free.
+    """
+    from werkzeug.wsgi import ClosingIterator
+
+    slots = threading.BoundedSemaphore(threads) if threads else None
+    streams = threading.BoundedSemaphore(live_streams) if live_streams > 0 else None
+
+    def limited_app(environ, start_response):
+        # Hold back the status until we know whether this is a live stream
+        started = []
+
+        def deferred_start_response(status, headers, exc_info=None):
+            started[:] = [status, headers, exc_info]
+            return lambda data: None
+
+        if slots:
+            slots.acquire()
+        try:
+            response = app(environ, deferred_start_response)
+        except BaseException:
+            if slots:
+                slots.release()
+            raise
+        status, headers, exc_info = started
+        content_type = next((value for name, value in headers if name.lower() == 'content-type'), '')
+
+        if not content_type.startswith('text/event-stream'):
+            start_response(status, headers, exc_info)
+            # Hold the slot until the body has been sent and the response closed
+            return ClosingIterator(response, slots.release) if slots else response
+
+        if slots:
+            slots.release()
+        if streams is None or not streams.acquire(blocking=False):
+            if hasattr(response, 'close'):
+                response.close()
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain'), ('Retry-After', '30')])
+            return [b'Too many live streams are open; close some live tabs and try again\n']
+        start_response(status, headers, exc_info)
+        return ClosingIterator(response, streams.release)
+
+    return limited_app
+
+
+def run_threaded(host, port, threads, live_streams):
+    """Serve with Werkzeug's threaded WSGI server in this process"""
+    from werkzeug.serving import make_server
+
+    app, timings = load_app()
+    _report_ready(f'Server on http://{host}:{port}', timings, STARTED)
+    # Werkzeug starts a thread per request; cap how many run at once
+    server = make_server(host, port, limit_requests(app, threads, live_streams), threaded=True)
+    server.serve_forever()
+
+
+def run_processes(host, port, workers, threads, live_streams):
+    """Serve with gunicorn: several worker processes, each with a thread pool
+    
+    A live stream keeps one of its worker's threads, so each worker allows
+    at most threads - 1 streams and always has a thread for other requests.
+    """
+    live_streams = min(live_streams, threads - 1)
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("❌ The processes mode needs gunicorn: pip install gunicorn")
+        return 1
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('post_fork', lambda server, worker: _worker_started.update(at=time.perf_counter()))
+
+        def load(self):
+            # Runs in each worker after the fork, so gRPC channels and
+            # caches are never shared between processes
+            app, timings = load_app()
+            _report_ready(f'Worker {os.getpid()}', timings, _worker_started['at'] or STARTED)
+            # gunicorn queues ordinary requests itself
+            return limit_requests(app, None, live_streams)
+
+    server = Server()
+    server.run()
+    return 0
+
+
+def _percentile(latencies, p):
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+
+def load_test(url, concurrency, requests, encoding):
+    """Hit a URL from several threads and report requests/s and latency"""
+    latencies = []
+    errors = [0]
+    received = [0]
+    lock = threading.Lock()
+
+    def fetch(_):
+        request = urllib.request.Request(url, headers={'Accept-Encoding': encoding})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                body = response.read()
+        except Exception:
+            with lock:
+                errors[0] += 1
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            received[0] += len(body)
+
+    # One request first so the server is warm for the measured run
+    fetch(None)
+    latencies.clear()
+    received[0] = 0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fetch, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50, p95, p99 = (_percentile(latencies, p) for p in (0.5, 0.95, 0.99))
+
+    print(f"✅ {len(latencies)} requests to {url} with {concurrency} concurrent clients")
+    print(f"   • requests/second: {len(latencies) / elapsed:,.1f}")
+    print(f"   • latency p50/p95/p99: {p50:.1f} / {p95:.1f} / {p99:.1f} ms")
+    print(f"   • average response size: {received[0] / max(1, len(latencies)):,.0f} bytes ({encoding or 'identity'})")
+    print(f"   • errors: {errors[0]}")
+    return 0 if not errors[0] else 1
+
+
+def bench_pages(paths, concurrency_levels, requests):
+    """Compare sequential and concurrent datastore fetches for the same pages
+    
+    Requests go through the app in this process (no HTTP server) with the
+    render cache off, so every request hits the datastore: the emulator of
+    the configured project, or OFFLINE_SNAPSHOT if that is set.
+    """
+    os.environ['RENDER_CACHE'] = 'false'
+    os.environ['COMPRESS_RESPONSES'] = 'false'
+    app, _ = load_app()
+    client = app.test_client()
+
+    results = []
+    for concurrent_fetch in (False, True):
+        app.config['CONCURRENT_FETCH'] = concurrent_fetch
+        mode = 'concurrent' if concurrent_fetch else 'sequential'
+        for path in paths:
+            # Untimed request so connections and kind lists are warm
+            response = client.get(path)
+            if response.status_code != 200:
+                print(f"❌ {path} returned {response.status_code}")
+                return 1
+            for concurrency in concurrency_levels:
+                latencies = []
+                lock = threading.Lock()
+
+                def fetch(_):
+                    started = time.perf_counter()
+                    status = app.test_client().get(path).status_code
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed if status == 200 else None)
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    list(executor.map(fetch, range(requests)))
+                elapsed = time.perf_counter() - started
+
+                errors = latencies.count(None)
+                latencies = sorted(latency for latency in latencies if latency is not None)
+                results.append((path, concurrency, mode, len(latencies) / elapsed,
+                                _percentile(latencies, 0.5), _percentile(latencies, 0.95), errors))
+
+    print(f"{'page':<30} {'users':>5} {'fetch':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}")
+    for path, concurrency, mode, rate, p50, p95, errors in sorted(results, key=lambda r: (r[0], r[1])):
+        print(f"{path:<30} {concurrency:>5} {mode:>10} {rate:>8.1f} {p50:>8.1f} {p95:>8.1f} {errors:>6}")
+    return 0
+
+
+def main(argv=None):
+    """Command line interface for serving and load testing"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Serve the Local Datastore Browser')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser.add_argument('--mode', choices=('threaded', 'processes'),
+                        default=os.getenv('SERVER_MODE', 'threaded'))
+    parser.add_argument('--host', default=os.getenv('SERVER_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('SERVER_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SERVER_WORKERS', min(4, os.cpu_count() or 1))))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('SERVER_THREADS', 8)))
+    parser.add_argument('--live-streams', type=int, default=int(os.getenv('SERVER_LIVE_STREAMS', 32)),
+                        help='open live streams allowed at once (per worker in processes mode)')
+
+    loadtest_parser = subparsers.add_parser('loadtest', help='measure requests/s against a running server')
+    loadtest_parser.add_argument('url')
+    loadtest_parser.add_argument('-c', '--concurrency', type=int, default=16)
+    loadtest_parser.add_argument('-n', '--requests', type=int, default=1000)
+    loadtest_parser.add_argument('--encoding', default='gzip, br',
+                                 help="Accept-Encoding header to send ('' for none)")
+
+    bench_parser = subparsers.add_parser('bench-pages', help='compare sequential and concurrent datastore fetches per page')
+    bench_parser.add_argument('kind', help='kind whose browse page (and first entity) to request')
+    bench_parser.add_argument('-c', '--concurrency', default='1,8,32',
+                              help='comma-separated numbers of concurrent users')
+    bench_parser.add_argument('-n', '--requests', type=int, default=200,
+                              help='requests per page, mode and concurrency level')
+    bench_parser.add_argument('--entity', help='entity ID to view (default: none)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'loadtest':
+        return load_test(args.url, args.concurrency, args.requests, args.encoding)
+    if args.command == 'bench-pages':
+        paths = ['/', f'/kind/{args.kind}']
+        if args.entity:
+            paths.append(f'/kind/{args.kind}/entity/{args.entity}')
+        levels = [int(level) for level in args.concurrency.split(',')]
+        return bench_pages(paths, levels, args.requests)
+
+    print(f"🌐 Starting {args.mode} server on {args.host}:{args.port}")
+    if args.mode == 'processes':
+        return run_processes(args.host, args.port, args.workers, args.threads, args.live_streams)
+    run_threaded(args.host, args.port, args.threads, args.live_streams)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
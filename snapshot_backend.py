@@ -0,0 +1,274 @@
+"""
+Read-only snapshot backend for the Local Datastore Browser
+
+SnapshotClient stands in for a datastore.Client when browsing an exported
+snapshot file without the emulator. The file is memory-mapped and read
+through the sorted key index and per-kind ranges written by snapshot.py, so
+opening a dump only reads its trailer and metadata. Entities are decoded
+when a page actually needs them; records in uncompressed snapshots
+(`snapshot.py snapshot --no-compress`) are parsed straight out of the
+mapping without copying.
+
+Only the calls the browse pages make are supported: key(), get(),
+get_multi(), and kind and ancestor queries with limit/offset or cursors.
+Writes raise ReadOnlySnapshotError.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from google.cloud import datastore
+
+from snapshot import (MAGIC, CODEC_ZLIB, BLOCK_HEADER, INDEX_ENTRY, OFFSET, TRAILER,
+                      encode_key, decode_key, decode_entity)
+
+# Decompressed blocks kept around for paging through compressed snapshots
+BLOCK_CACHE_SIZE = 32
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+class ReadOnlySnapshotError(RuntimeError):
+    """Raised when something tries to write to a snapshot"""
+
+
+class UnsupportedSnapshotQueryError(ValueError):
+    """Raised for queries a snapshot can't answer, such as property filters"""
+
+
+class _IndexView:
+    """Sequence of encoded keys backed by the snapshot's index, for bisect"""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return self._snapshot.count
+
+    def __getitem__(self, position):
+        return self._snapshot.key_bytes(position)
+
+
+class SnapshotClient:
+    """A read-only, memory-mapped view of a snapshot file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f'Not a snapshot file: {path}')
+
+        if self._map[:len(MAGIC)] != MAGIC or len(self._map) < len(MAGIC) + TRAILER.size:
+            self.close()
+            raise ValueError(f'Not a snapshot file: {path}')
+        (self._blocks_end, self._offsets_offset, self.count,
+         metadata_offset, metadata_length, magic) = TRAILER.unpack_from(self._map, len(self._map) - TRAILER.size)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'Not a snapshot file: {path}')
+
+        self.metadata = json.loads(self._map[metadata_offset:metadata_offset + metadata_length])
+        self.project = self.metadata['project']
+        self.namespace = self.metadata['namespace']
+        self.kinds = {kind: tuple(span) for kind, span in self.metadata['kinds'].items()}
+
+        self._view = memoryview(self._map)
+        self._blocks = OrderedDict()
+        self._blocks_lock = threading.Lock()
+
+    def close(self):
+        if hasattr(self, '_view'):
+            self._view.release()
+        self._map.close()
+        self._file.close()
+
+    # Index access
+
+    def _entry(self, position):
+        (entry_offset,) = OFFSET.unpack_from(self._map, self._offsets_offset + position * OFFSET.size)
+        block_offset, record_offset, length, key_length = INDEX_ENTRY.unpack_from(self._map, entry_offset)
+        key_start = entry_offset + INDEX_ENTRY.size
+        return block_offset, record_offset, length, key_start, key_length
+
+    def key_bytes(self, position):
+        """The encoded key stored at a position of the index"""
+        _, _, _, key_start, key_length = self._entry(position)
+        return self._map[key_start:key_start + key_length]
+
+    def key_at(self, position):
+        """The datastore.Key stored at a position of the index"""
+        return self.key(*decode_key(self.key_bytes(position)))
+
+    def _block(self, block_offset):
+        """Raw payload of a block, decompressing (and caching) if needed"""
+        codec, stored_length, _ = BLOCK_HEADER.unpack_from(self._map, block_offset)
+        start = block_offset + BLOCK_HEADER.size
+        if codec != CODEC_ZLIB:
+            return self._view[start:start + stored_length]
+
+        with self._blocks_lock:
+            raw = self._blocks.get(block_offset)
+            if raw is not None:
+                self._blocks.move_to_end(block_offset)
+                return raw
+        raw = memoryview(zlib.decompress(self._view[start:start + stored_length]))
+        with self._blocks_lock:
+            self._blocks[block_offset] = raw
+            while len(self._blocks) > BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return raw
+
+    def entity_at(self, position):
+        """Decode the entity stored at a position of the index"""
+        block_offset, record_offset, length, _, _ = self._entry(position)
+        entity = decode_entity(self._block(block_offset)[record_offset:record_offset + length])
+        # Present the entity under this snapshot's project and namespace
+        entity.key = self.key(*entity.key.flat_path)
+        return entity
+
+    def find(self, key):
+        """Index position of a key, or None"""
+        encoded = encode_key(key.flat_path)
+        start, count = self.kinds.get(key.kind, (0, 0))
+        position = bisect.bisect_left(_IndexView(self), encoded, start, start + count)
+        if position < start + count and self.key_bytes(position) == encoded:
+            return position
+        return None
+
+    def descendants(self, ancestor, kind=None):
+        """Index positions of an ancestor and everything under it, in key order
+        
+        Within a kind, keys sort by their full path, so each kind holds the
+        descendants of a key as one contiguous run. The runs are then merged
+        by path, which puts the ancestor itself first, as Datastore does.
+        """
+        encoded = encode_key(ancestor.flat_path)
+        path = encoded[encoded.index(b'\x00') + 1:]
+        positions = []
+        for name in [kind] if kind else sorted(self.kinds):
+            start, count = self.kinds.get(name, (0, 0))
+            prefix = name.encode('utf-8') + b'\x00' + path
+            position = bisect.bisect_left(_IndexView(self), prefix, start, start + count)
+            while position < start + count:
+                key_bytes = self.key_bytes(position)
+                if not key_bytes.startswith(prefix):
+                    break
+                # Sort on the path alone, without the leaf kind in front
+                positions.append((key_bytes[key_bytes.index(b'\x00') + 1:], position))
+                position += 1
+        return [position for _, position in sorted(positions)]
+
+    # datastore.Client interface
+
+    def key(self, *path_args, **kwargs):
+        kwargs.setdefault('project', self.project)
+        kwargs.setdefault('namespace', self.namespace)
+        return datastore.Key(*path_args, **kwargs)
+
+    def get(self, key, **kwargs):
+        position = self.find(key)
+        return self.entity_at(position) if position is not None else None
+
+    def get_multi(self, keys, missing=None, **kwargs):
+        entities = []
+        for key in keys:
+            entity = self.get(key)
+            if entity is not None:
+                entities.append(entity)
+            elif missing is not None:
+                missing.append(datastore.Entity(key=key))
+        return entities
+
+    def query(self, kind=None, ancestor=None, **kwargs):
+        if kwargs.get('filters'):
+            raise UnsupportedSnapshotQueryError('Snapshot browsing does not support filters')
+        return SnapshotQuery(self, kind, ancestor)
+
+    def _read_only(self, *args, **kwargs):
+        raise ReadOnlySnapshotError(f'{os.path.basename(self.path)} is a read-only snapshot')
+
+    put = put_multi = delete = delete_multi = _read_only
+
+
+class SnapshotQuery:
+    """Kind or ancestor query over a snapshot's index, in key order"""
+
+    def __init__(self, client, kind=None, ancestor=None):
+        self.client = client
+        self.kind = kind
+        self.ancestor = ancestor
+        self._keys_only = False
+
+    def keys_only(self):
+        self._keys_only = True
+
+    def add_filter(self, *args, **kwargs):
+        raise UnsupportedSnapshotQueryError('Snapshot browsing does not support filters')
+
+    def _positions(self):
+        if self.ancestor is not None:
+            return self.client.descendants(self.ancestor, self.kind)
+        if self.kind is None:
+            return range(self.client.count)
+        start, count = self.client.kinds.get(self.kind, (0, 0))
+        return range(start, start + count)
+
+    def fetch(self, limit=None, offset=0, start_cursor=None, **kwargs):
+        if self.kind == '__kind__':
+            kinds = sorted(self.client.kinds)[offset:]
+            return iter([datastore.Entity(key=self.client.key('__kind__', kind))
+                         for kind in kinds[:limit]])
+
+        positions = self._positions()
+        # Cursors are plain result offsets
+        first = int(start_cursor) if start_cursor else min(offset or 0, len(positions))
+        last = len(positions) if limit is None else min(len(positions), first + limit)
+        next_cursor = str(last).encode('ascii') if last < len(positions) else None
+        return SnapshotIterator(self, positions[first:last], next_cursor)
+
+    def _entity(self, position):
+        if self._keys_only:
+            return datastore.Entity(key=self.client.key_at(position))
+        return self.client.entity_at(position)
+
+
+class SnapshotIterator:
+    """Lazy query results with the pages/next_page_token interface of the client's iterators"""
+
+    def __init__(self, query, positions, next_page_token):
+        self._query = query
+        self._positions = positions
+        self.next_page_token = next_page_token
+
+    def __len__(self):
+        return len(self._positions)
+
+    @property
+    def pages(self):
+        yield iter(self)
+
+    def __iter__(self):
+        for position in self._positions:
+            yield self._query._entity(position)
+
+
+def open_snapshot(path):
+    """Open (or reuse) a read-only client for a snapshot file"""
+    path = os.path.realpath(path)
+    stamp = os.path.getmtime(path)
+    with _snapshots_lock:
+        cached = _snapshots.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        client = SnapshotClient(path)
+        _snapshots[path] = (stamp, client)
+    return client
@@ -129,7 +129,12 @@ set_env_vars() {
 start_flask() {
     echo "🌐 Starting Flask application..."
     # Make sure we're using the virtual environment's Python
-    ./venv/bin/python app.py &
+    # Set DEV_SERVER=1 for Flask's debug server with the reloader
+    if [ "$DEV_SERVER" = "1" ]; then
+        ./venv/bin/python app.py &
+    else
+        ./venv/bin/python serve.py &
+    fi
     FLASK_PID=$!
     
     # Wait for Flask to start